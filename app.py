@@ -1,5 +1,7 @@
 # app.py
-import os, sqlite3, requests, hashlib
+import os, re, io, csv, sqlite3, threading, requests, hashlib, hmac
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
 import streamlit as st
 
@@ -8,10 +10,15 @@ import streamlit as st
 # =========================
 APP_PASSWORD = os.environ.get("APP_PASSWORD", "")
 
+@st.cache_resource
+def password_hash():
+    # Streamlit re-executes this module on every rerun; cache so the env password is hashed once per process
+    return hashlib.sha256(APP_PASSWORD.encode()).digest()
+
 def check_password():
     def password_entered():
-        ok = hashlib.sha256(st.session_state["password"].encode()).hexdigest() == \
-             hashlib.sha256(APP_PASSWORD.encode()).hexdigest()
+        # constant-time compare against the cached hash of APP_PASSWORD
+        ok = hmac.compare_digest(hashlib.sha256(st.session_state["password"].encode()).digest(), password_hash())
         st.session_state["password_ok"] = ok
         # never keep raw password
         if "password" in st.session_state:
@@ -36,7 +43,9 @@ st.set_page_config(page_title="Business Directory", layout="wide")
 
 DB_PATH = "data.db"
 DB_URL = os.environ.get("DB_URL", "")  # e.g. Dropbox direct link with dl=1
-DOWNLOAD_CHUNK = 1 << 14  # 16KB
+DOWNLOAD_CHUNK = 1 << 20  # 1MB
+DOWNLOAD_RANGE = 8 << 20  # 8MB per Range request
+DOWNLOAD_WORKERS = 8
 
 CUSTOM_CSS = """
 <style>
@@ -52,11 +61,6 @@ h1 { letter-spacing: -0.02em; margin-bottom: 0.15rem; }
 .kpi .label { font-size: 0.82rem; color:#6b7280; }
 .kpi .value { font-size: 1.4rem; font-weight: 700; margin-top: 2px; }
 
-/* Table */
-table { width: 100%; border-collapse: separate; border-spacing: 0; }
-thead th { position: sticky; top: 0; background: #fff; border-bottom: 1px solid #eee; z-index: 2; }
-tbody tr:nth-child(even) { background: #fafafa; }
-td, th { padding: 10px 12px; vertical-align: top; white-space: nowrap; max-width: 420px; text-overflow: ellipsis; overflow: hidden; }
 a { text-decoration: none; }
 
 /* Footer */
@@ -73,77 +77,294 @@ a { text-decoration: none; }
 """
 st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
+def download_stream(url, path, prog):
+    with requests.get(url, stream=True, timeout=120) as r:
+        r.raise_for_status()
+        total = int(r.headers.get("Content-Length", "0"))
+        wrote = 0
+        with open(path, "wb") as f:
+            for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK):
+                if chunk:
+                    f.write(chunk)
+                    wrote += len(chunk)
+                    if total:
+                        prog.progress(min(1.0, wrote / total))
+
+def download_ranged(url, path, total, prog):
+    # parallel Range requests, each written at its own offset of a preallocated file
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, total)
+        else:
+            os.ftruncate(fd, total)
+
+        stop = threading.Event()  # set on the first failure so in-flight ranges bail out early
+
+        def fetch(start, end):
+            with requests.get(url, headers={"Range": f"bytes={start}-{end}"}, stream=True, timeout=120) as r:
+                r.raise_for_status()
+                if r.status_code != 206:
+                    raise RuntimeError("server ignored the Range header")
+                pos = start
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK):
+                    if stop.is_set():
+                        raise RuntimeError("cancelled")
+                    os.pwrite(fd, chunk, pos)
+                    pos += len(chunk)
+            if pos != end + 1:
+                raise RuntimeError(f"short read for bytes {start}-{end}")
+            return end + 1 - start
+
+        ranges = [(a, min(a + DOWNLOAD_RANGE, total) - 1) for a in range(0, total, DOWNLOAD_RANGE)]
+        wrote = 0
+        pool = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS)
+        try:
+            # progress is updated here on the script thread; st elements can't be touched from workers
+            for fut in as_completed([pool.submit(fetch, a, b) for a, b in ranges]):
+                wrote += fut.result()
+                prog.progress(min(1.0, wrote / total))
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            # drop queued ranges; only wait for workers already writing to fd
+            pool.shutdown(wait=True, cancel_futures=True)
+    finally:
+        os.close(fd)
+
 # Download DB on first run (if not present)
 if not os.path.exists(DB_PATH):
     if not DB_URL:
         st.error("DB_URL is not set. Please configure it in Streamlit secrets.")
         st.stop()
     st.info("Downloading database… first run may take a while.")
+    tmp_path = DB_PATH + ".part"  # only renamed into place once complete
     try:
-        with requests.get(DB_URL, stream=True, timeout=120) as r:
-            r.raise_for_status()
-            total = int(r.headers.get("Content-Length", "0"))
-            prog = st.progress(0)
-            wrote = 0
-            with open(DB_PATH, "wb") as f:
-                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK):
-                    if chunk:
-                        f.write(chunk)
-                        wrote += len(chunk)
-                        if total:
-                            prog.progress(min(1.0, wrote / total))
+        prog = st.progress(0)
+        # HEAD is only a probe for parallel ranges; hosts that reject it still get the plain GET
+        try:
+            head = requests.head(DB_URL, allow_redirects=True, timeout=30)
+            head.raise_for_status()
+            total = int(head.headers.get("Content-Length", "0"))
+            ranged = total > 0 and head.headers.get("Accept-Ranges", "").lower() == "bytes" and hasattr(os, "pwrite")
+        except (requests.RequestException, ValueError):
+            ranged = False
+        if ranged:
+            try:
+                download_ranged(head.url, tmp_path, total, prog)
+            except (RuntimeError, requests.RequestException, OSError):
+                download_stream(DB_URL, tmp_path, prog)  # ranges refused or throttled; single stream
+        else:
+            download_stream(DB_URL, tmp_path, prog)
+        os.replace(tmp_path, DB_PATH)
         st.success("Database downloaded.")
     except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
         st.error(f"Failed to download DB: {e}")
         st.stop()
 
 # =========================
 # Helpers
 # =========================
+@st.cache_resource
+def get_con():
+    # one shared read-only handle per process; keeps SQLite's page cache warm across reruns.
+    # immutable=1 skips file locking and change detection: prepare_db() is the only writer
+    # and always finishes before this connection is opened.
+    # sqlite3 reuses compiled statements by SQL text; the helpers' f-strings are stable per
+    # (table, column), so a bigger statement cache keeps them and the page queries prepared.
+    con = sqlite3.connect(
+        f"file:{DB_PATH}?mode=ro&immutable=1", uri=True, check_same_thread=False,
+        detect_types=0, cached_statements=256,
+    )
+    con.execute("PRAGMA query_only=1")
+    con.execute("PRAGMA temp_store=MEMORY")
+    con.execute("PRAGMA mmap_size=1073741824")  # 1GB
+    con.execute("PRAGMA cache_size=-131072")    # 128MB
+    return con
+
+# NOCASE indexes prepare_db() builds when FTS5 is unavailable, so case-insensitive LIKE 'q%' runs as a range seek
+NOCASE_INDEXES = {"name_std": "idx_name_std_nocase", "full_address": "idx_address_nocase"}
+
+@st.cache_resource
+def prepare_db():
+    # one-time indexes on a short-lived writable handle, run before get_con() opens read-only.
+    # these are optimizations only; the app still works (more slowly) if any step fails.
+    con = sqlite3.connect(DB_PATH, isolation_level=None)
+    try:
+        # table_xinfo, unlike table_info, also lists generated columns such as name_sort
+        cols = {r[1] for r in con.execute("PRAGMA table_xinfo(records_norm)")}
+        if "name_sort" not in cols and sort_expr(cols):
+            # materialize the sort key as a generated column so ORDER BY name_sort can walk an index;
+            # the old indexes on the COALESCE expression are rebuilt on the column below
+            try:
+                con.execute(f"ALTER TABLE records_norm ADD COLUMN name_sort TEXT GENERATED ALWAYS AS ({sort_expr(cols)}) VIRTUAL")
+                for name in ["idx_name_rowid", "idx_city_name", "idx_state_name", "idx_zip_name"]:
+                    con.execute(f"DROP INDEX IF EXISTS {name}")
+                cols.add("name_sort")
+            except sqlite3.OperationalError as e:
+                if "duplicate column" in str(e):
+                    cols.add("name_sort")  # already there; just make sure the indexes use it
+                # otherwise SQLite < 3.31 has no generated columns; keep sorting on the expression
+        key = sort_expr(cols)
+        if key:
+            # keyset pagination seeks on (sort key, rowid); rowid is implicit in every index
+            con.execute(f"CREATE INDEX IF NOT EXISTS idx_name_sort ON records_norm({key})")
+            # filter + sort composites: after a city / state / ZIP seek, rows already come in page order.
+            # idx_zip_name also serves the ZIP prefix range, so it replaces the old single-column idx_zip.
+            composites = {
+                "idx_city_name": "city",
+                "idx_state_name": "state_std" if "state_std" in cols else "state",
+                "idx_zip_name": "postal_code_std" if "postal_code_std" in cols else "postal_code",
+            }
+            have = {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+            todo = {name: col for name, col in composites.items() if col in cols and name not in have}
+            for name, col in todo.items():
+                con.execute(f"CREATE INDEX {name} ON records_norm({col}, {key})")
+            if todo:
+                con.execute("DROP INDEX IF EXISTS idx_zip")
+                con.execute("ANALYZE")
+        # small lookup tables for the City / State dropdowns, so they never scan records_norm
+        for col in ["city", "state_std", "state"]:
+            if col in cols:
+                con.execute(f"CREATE TABLE IF NOT EXISTS _{col}_index AS SELECT DISTINCT {col} AS v FROM records_norm WHERE {col} IS NOT NULL")
+        # KPI scalars that never change for a given DB, read back as O(1) lookups
+        if cols and not con.execute("SELECT 1 FROM sqlite_master WHERE name='_stats'").fetchone():
+            zip_col = "postal_code_std" if "postal_code_std" in cols else "postal_code"
+            con.execute("BEGIN")
+            con.execute("CREATE TABLE _stats(k TEXT PRIMARY KEY, v INTEGER)")
+            con.execute("INSERT INTO _stats VALUES ('n_rows', (SELECT COUNT(*) FROM records_norm))")
+            if "city" in cols:
+                con.execute("INSERT INTO _stats VALUES ('n_cities', (SELECT COUNT(DISTINCT city) FROM records_norm))")
+            if zip_col in cols:
+                con.execute(f"INSERT INTO _stats VALUES ('n_zips', (SELECT COUNT(DISTINCT {zip_col}) FROM records_norm))")
+            con.execute("COMMIT")
+        fts_cols = [c for c in ["name_std", "full_address", "site"] if c in cols]
+        has_fts = con.execute("SELECT 1 FROM sqlite_master WHERE name='records_fts'").fetchone()
+        if fts_cols and not has_fts:
+            try:
+                con.execute("BEGIN")
+                con.execute(f"CREATE VIRTUAL TABLE records_fts USING fts5({', '.join(fts_cols)}, content='records_norm', content_rowid='rowid')")
+                con.execute("INSERT INTO records_fts(records_fts) VALUES('rebuild')")
+                con.execute("COMMIT")
+                has_fts = True
+            except sqlite3.Error:
+                con.execute("ROLLBACK")  # no FTS5 in this build; keyword search falls back to LIKE
+        if has_fts:
+            # the NOCASE prefix path never runs next to FTS5; don't keep its indexes around
+            for name in NOCASE_INDEXES.values():
+                con.execute(f"DROP INDEX IF EXISTS {name}")
+        else:
+            for col, name in NOCASE_INDEXES.items():
+                if col in cols:
+                    con.execute(f"CREATE INDEX IF NOT EXISTS {name} ON records_norm({col} COLLATE NOCASE)")
+    except sqlite3.Error:
+        pass
+    finally:
+        con.close()
+
+def sort_expr(cols):
+    # NULL-free sort key, so (key, rowid) row-value comparisons never skip rows
+    if "name_sort" in cols:
+        return "name_sort"
+    names = [c for c in ["name_std", "name"] if c in cols]
+    return f"COALESCE({', '.join(names)}, '')" if names else None
+
+def prefix_range(prefix):
+    # 'abc' -> ('abc', 'abd'): col >= lo AND col < hi is an index seek, unlike LIKE 'abc%'
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def like_escape(s):
+    # literal match for user text in LIKE ... ESCAPE '\\'; keeps 'q%' prefix seeks intact
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def fts_query(q):
+    # quoted phrase with a trailing prefix star; None when there is nothing to tokenize
+    if not re.search(r"\w", q):
+        return None
+    return '"' + q.replace('"', '""') + '"*'
+
 def get_columns(con, table):
-    return set(pd.read_sql(f"PRAGMA table_info({table});", con)["name"].tolist())
+    return {r[1] for r in con.execute(f"PRAGMA table_xinfo({table});")}
 
 def list_tables(con):
-    return pd.read_sql("SELECT name FROM sqlite_master WHERE type='table'", con)["name"].tolist()
+    return [r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type='table'")]
 
-def count_all(con, table, where_sql="", params=()):
-    return int(pd.read_sql(f"SELECT COUNT(*) AS c FROM {table} {where_sql}", con, params=params)["c"].iat[0])
+# cached on the query inputs; the leading underscore keeps the connection out of the cache key
+@st.cache_data(show_spinner=False, ttl=3600)
+def count_all(_con, table, where_sql="", params=()):
+    return _con.execute(f"SELECT COUNT(*) FROM {table} {where_sql}", params).fetchone()[0]
 
-def distinct_count(con, table, col):
-    cols = get_columns(con, table)
+@st.cache_data(show_spinner=False, ttl=3600)
+def distinct_count(_con, table, col):
+    cols = get_columns(_con, table)
     if col not in cols: return 0
-    return int(pd.read_sql(f"SELECT COUNT(DISTINCT {col}) AS c FROM {table} WHERE {col} IS NOT NULL", con)["c"].iat[0])
+    return _con.execute(f"SELECT COUNT(DISTINCT {col}) FROM {table} WHERE {col} IS NOT NULL").fetchone()[0]
 
-def value_list(con, table, col):
-    cols = get_columns(con, table)
+@st.cache_data(show_spinner=False, ttl=3600)
+def value_list(_con, table, col):
+    if table == "records_norm" and f"_{col}_index" in list_tables(_con):
+        return [r[0] for r in _con.execute(f"SELECT v FROM _{col}_index WHERE v IS NOT NULL ORDER BY 1")]
+    cols = get_columns(_con, table)
     if col not in cols: return []
-    return pd.read_sql(f"SELECT DISTINCT {col} AS v FROM {table} WHERE {col} IS NOT NULL ORDER BY 1", con)["v"].dropna().tolist()
-
-def make_link(url):
-    if isinstance(url, str) and url.startswith(("http://", "https://")):
-        return f'<a href="{url}" target="_blank">Open</a>'
-    return ""
+    return [r[0] for r in _con.execute(f"SELECT DISTINCT {col} FROM {table} WHERE {col} IS NOT NULL ORDER BY 1")]
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def fetch_page(_con, sql, params=()):
+    # recently viewed pages, keyed on (sql, filters + cursor + page size); Prev/Next back and forth skips the DB
+    return pd.read_sql(sql, _con, params=list(params))
+
+@st.cache_resource(max_entries=2, ttl=600, show_spinner="Preparing CSV…")
+def query_csv(_con, sql, params=(), batch=10000):
+    # cursor -> CSV in batches, without building a DataFrame for the whole result;
+    # cache_resource hands back the same bytes object (no per-rerun copy, unlike cache_data),
+    # so Prev/Next and the download click itself reuse the export
+    cur = _con.execute(sql, params)
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    w.writerow([d[0] for d in cur.description])
+    for rows in iter(lambda: cur.fetchmany(batch), []):
+        w.writerows(rows)
+    return buf.getvalue().encode("utf-8")
+
+@st.cache_resource
+def schema_info():
+    # table / column discovery; the schema doesn't change while the app runs
+    con = get_con()
+    tables = list_tables(con)
+    table = "records_norm" if "records_norm" in tables else ("records" if "records" in tables else None)
+    existing = get_columns(con, table) if table else set()
+    zip_field = "postal_code_std" if "postal_code_std" in existing else ("postal_code" if "postal_code" in existing else None)
+    # declared type -> affinity; only TEXT-affinity columns compare as strings against bound text
+    zip_type = next((r[2].upper() for r in con.execute(f"PRAGMA table_xinfo({table})") if r[1] == zip_field), "") if zip_field else ""
+    return SimpleNamespace(
+        TABLE=table,
+        tables=tables,
+        indexes={r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type='index'")},
+        existing=existing,
+        name_col="name_std" if "name_std" in existing else ("name" if "name" in existing else None),
+        state_field="state_std" if "state_std" in existing else ("state" if "state" in existing else None),
+        zip_field=zip_field,
+        zip_is_text="INT" not in zip_type and any(t in zip_type for t in ("CHAR", "CLOB", "TEXT")),
+    )
 
 # =========================
 # Pick the working table
 # =========================
-with sqlite3.connect(DB_PATH) as con:
-    tables = list_tables(con)
-if "records_norm" in tables:
-    TABLE = "records_norm"
-elif "records" in tables:
-    TABLE = "records"
-else:
+prepare_db()
+con = get_con()
+S = schema_info()
+if not S.TABLE:
     st.error("No 'records_norm' or 'records' table found in the database.")
     st.stop()
+TABLE, tables, existing = S.TABLE, S.tables, S.existing
 
-# Figure out columns & choose defaults
-with sqlite3.connect(DB_PATH) as con:
-    existing = get_columns(con, TABLE)
-    name_col = "name_std" if "name_std" in existing else ("name" if "name" in existing else None)
-    city_list = value_list(con, TABLE, "city") if "city" in existing else []
-    state_field = "state_std" if "state_std" in existing else ("state" if "state" in existing else None)
-    state_list = value_list(con, TABLE, state_field) if state_field else []
+# Columns & defaults
+name_col, state_field, zip_field = S.name_col, S.state_field, S.zip_field
+city_list = value_list(con, TABLE, "city") if "city" in existing else []
+state_list = value_list(con, TABLE, state_field) if state_field else []
 
 # =========================
 # UI
@@ -155,20 +376,36 @@ st.markdown('<div class="small-subtle">Fast search & filters on a normalized dat
 with st.sidebar:
     st.header("Filters")
     kw_fields = [c for c in [name_col, "full_address", "site"] if c and c in existing]
-    q = st.text_input("Keyword (name / address / website)")
-    city = st.selectbox("City", ["(any)"] + city_list) if city_list else "(any)"
-    state = st.selectbox("State", ["(any)"] + state_list) if state_list else "(any)"
-    zip_like = st.text_input("ZIP / Postal (starts with)")  # prefix filter
-    st.markdown("---")
-    page_size = st.number_input("Rows per page", 10, 200, 50, 10)
+    # prefix-only matching is only a stand-in for FTS5, and only worth it when every field
+    # has its NOCASE index to seek on; punctuation-only input with FTS5 keeps the %q% substring path
+    prefix_fields = [c for c in [name_col, "full_address"] if c and c in existing]
+    prefix_ok = TABLE == "records_norm" and "records_fts" not in tables and prefix_fields and all(NOCASE_INDEXES.get(c) in S.indexes for c in prefix_fields)
+    # a form only reruns the script on submit (button or Enter), not on every keystroke
+    with st.form("filters"):
+        q = st.text_input("Keyword (name / address / website)")
+        city = st.selectbox("City", ["(any)"] + city_list) if city_list else "(any)"
+        state = st.selectbox("State", ["(any)"] + state_list) if state_list else "(any)"
+        zip_like = st.text_input("ZIP / Postal (starts with)")  # prefix filter
+        st.markdown("---")
+        page_size = st.number_input("Rows per page", 10, 200, 50, 10)
+        st.form_submit_button("Apply", width="stretch")
 
 # Build WHERE
 where, params = [], []
 
-if q and kw_fields:
-    like_clause = " OR ".join([f"{c} LIKE ?" for c in kw_fields])
+fts_q = fts_query(q) if (q and TABLE == "records_norm" and "records_fts" in tables) else None
+if fts_q:
+    where.append("rowid IN (SELECT rowid FROM records_fts WHERE records_fts MATCH ?)")
+    params.append(fts_q)
+elif q and prefix_ok and not re.search(r"\s", q):
+    # single word: indexed prefix match on name / address
+    like_clause = " OR ".join([f"{c} LIKE ? ESCAPE '\\'" for c in prefix_fields])
+    where.append(f"({like_clause})")
+    params += [f"{like_escape(q)}%"] * len(prefix_fields)
+elif q and kw_fields:
+    like_clause = " OR ".join([f"{c} LIKE ? ESCAPE '\\'" for c in kw_fields])
     where.append(f"({like_clause})")
-    params += [f"%{q}%"] * len(kw_fields)
+    params += [f"%{like_escape(q)}%"] * len(kw_fields)
 
 if "city" in existing and city != "(any)":
     where.append("city = ?"); params.append(city)
@@ -176,18 +413,74 @@ if "city" in existing and city != "(any)":
 if state_field and state != "(any)":
     where.append(f"{state_field} = ?"); params.append(state)
 
-zip_field = "postal_code_std" if "postal_code_std" in existing else ("postal_code" if "postal_code" in existing else None)
 if zip_field and zip_like.strip():
-    where.append(f"{zip_field} LIKE ?"); params.append(zip_like.strip() + "%")
+    zip_prefix = zip_like.strip()
+    if S.zip_is_text and zip_field == "postal_code_std":
+        # BINARY range seek; postal_code_std holds upper-case codes, so normalise the input to match
+        where.append(f"{zip_field} >= ? AND {zip_field} < ?"); params += prefix_range(zip_prefix.upper())
+    else:
+        # raw / numeric columns: case-insensitive LIKE, since a text range would miss mixed case
+        # or compare across storage classes
+        where.append(f"{zip_field} LIKE ? ESCAPE '\\'"); params.append(like_escape(zip_prefix) + "%")
 
 where_sql = ("WHERE " + " AND ".join(where)) if where else ""
 
+# Visible columns (prefer name_std; no lat/lng)
+select_schema = [
+    (("name_std" if "name_std" in existing else "name") if name_col else None, "Name"),
+    ("phone", "Phone"),
+    ("full_address", "Address"),
+    ("city", "City"),
+    (state_field, "State") if state_field else (None, None),
+    (zip_field, "ZIP") if zip_field else (None, None),
+    ("country", "Country"),
+    ("location_link", "Map"),
+    ("site", "Website"),
+]
+select_list = [f'{col} AS "{label}"' for col, label in select_schema if col and col in existing]
+if not select_list:
+    st.error("No expected columns found.")
+    st.stop()
+
+order_expr = sort_expr(existing) or f"IFNULL({select_list[0].split(' AS ')[0]}, '')"
+
+# Keyset pagination: each cursor is the (sort key, rowid) of the last row of a previous page,
+# so any page is an index seek instead of walking and discarding OFFSET rows
+pager_sig = (where_sql, tuple(params), int(page_size))
+if st.session_state.get("pager_sig") != pager_sig:
+    st.session_state.pager_sig = pager_sig
+    st.session_state.cursor_stack = []
+cursor_stack = st.session_state.cursor_stack
+page = len(cursor_stack) + 1
+offset = (page - 1) * page_size
+
+page_where, page_params = list(where), list(params)
+if cursor_stack:
+    key, rowid = cursor_stack[-1]
+    page_where.append(f"{order_expr} >= ? AND ({order_expr}, rowid) > (?, ?)")
+    page_params += [key, key, rowid]
+page_where_sql = ("WHERE " + " AND ".join(page_where)) if page_where else ""
+
+sql = f"""
+SELECT {", ".join(select_list)}, {order_expr} AS __key, rowid AS __rowid
+FROM {TABLE}
+{page_where_sql}
+ORDER BY {order_expr}, rowid
+LIMIT ?;
+"""
+df = fetch_page(con, sql, tuple(page_params + [int(page_size)]))
+if not df.empty:
+    st.session_state.last_key = (df["__key"].iat[-1], int(df["__rowid"].iat[-1]))
+df = df.drop(columns=["__key", "__rowid"])
+
+# cached per filter set, so paging through results doesn't recount
+filtered_rows = count_all(con, TABLE, where_sql, tuple(params))
+
 # KPIs
-with sqlite3.connect(DB_PATH) as con:
-    total_rows    = count_all(con, TABLE)
-    filtered_rows = count_all(con, TABLE, where_sql, params)
-    n_cities      = distinct_count(con, TABLE, "city")
-    n_zips        = distinct_count(con, TABLE, "postal_code_std" if "postal_code_std" in existing else "postal_code")
+stats = dict(con.execute("SELECT k, v FROM _stats")) if (TABLE == "records_norm" and "_stats" in tables) else {}
+total_rows    = stats["n_rows"] if "n_rows" in stats else count_all(con, TABLE)
+n_cities      = stats["n_cities"] if "n_cities" in stats else distinct_count(con, TABLE, "city")
+n_zips        = stats["n_zips"] if "n_zips" in stats else distinct_count(con, TABLE, "postal_code_std" if "postal_code_std" in existing else "postal_code")
 
 c1, c2, c3, c4 = st.columns(4)
 with c1:
@@ -202,75 +495,51 @@ with c4:
 st.divider()
 
 # Pagination (Prev/Next)
-if "page" not in st.session_state:
-    st.session_state.page = 1
 max_page = max(1, (filtered_rows + page_size - 1) // page_size)
-if st.session_state.page > max_page: st.session_state.page = max_page
-if st.session_state.page < 1: st.session_state.page = 1
-offset = (st.session_state.page - 1) * page_size
+
+def next_page():
+    st.session_state.cursor_stack.append(st.session_state.last_key)
+
+def prev_page():
+    st.session_state.cursor_stack.pop()
 
 col_prev, col_info, col_next = st.columns([1,3,1])
 with col_prev:
-    if st.button("◀ Prev") and st.session_state.page > 1:
-        st.session_state.page -= 1
+    st.button("◀ Prev", on_click=prev_page, disabled=page <= 1)
 with col_next:
-    if st.button("Next ▶") and st.session_state.page < max_page:
-        st.session_state.page += 1
+    st.button("Next ▶", on_click=next_page, disabled=page >= max_page)
 with col_info:
     start_row = 0 if filtered_rows == 0 else offset + 1
     end_row   = min(filtered_rows, offset + page_size)
-    st.markdown(f"<div class='pager'><span class='info'>Page <b>{st.session_state.page}</b> of <b>{max_page}</b> — showing {start_row}–{end_row} of {filtered_rows}</span></div>", unsafe_allow_html=True)
+    st.markdown(f"<div class='pager'><span class='info'>Page <b>{page}</b> of <b>{max_page}</b> — showing {start_row}–{end_row} of {filtered_rows}</span></div>", unsafe_allow_html=True)
 
-# Visible columns (prefer name_std; no lat/lng)
-select_schema = [
-    (("name_std" if "name_std" in existing else "name") if name_col else None, "Name"),
-    ("phone", "Phone"),
-    ("full_address", "Address"),
-    ("city", "City"),
-    (state_field, "State") if state_field else (None, None),
-    (zip_field, "ZIP") if zip_field else (None, None),
-    ("country", "Country"),
-    ("location_link", "Map"),
-    ("site", "Website"),
-]
-select_list = [f'{col} AS "{label}"' for col, label in select_schema if col and col in existing]
-if not select_list:
-    st.error("No expected columns found.")
-    st.stop()
-
-order_expr = "COALESCE(name_std, name)" if ("name_std" in existing or "name" in existing) else select_list[0].split(" AS ")[0]
-
-sql = f"""
-SELECT {", ".join(select_list)}
-FROM {TABLE}
-{where_sql}
-ORDER BY {order_expr}
-LIMIT ? OFFSET ?;
-"""
-params2 = params + [int(page_size), int(offset)]
-
-with sqlite3.connect(DB_PATH) as con:
-    df = pd.read_sql(sql, con, params=params2)
-
-def linkify(df_):
-    for col in ["Map", "Website"]:
-        if col in df_.columns:
-            df_[col] = df_[col].apply(lambda u: f'<a href="{u}" target="_blank">Open</a>' if isinstance(u,str) and u.startswith(("http://","https://")) else "")
-    return df_
+# only keep real http(s) links for the link columns (vectorized, no per-cell lambda)
+for col in ["Map", "Website"]:
+    if col in df.columns:
+        df[col] = df[col].where(df[col].str.startswith(("http://", "https://"), na=False), "")
 
 if not df.empty:
-    df = linkify(df.copy())
     st.subheader("Results")
     st.caption("Use sidebar filters. Download the current page or full filtered data below.")
-    st.write(df.to_html(escape=False, index=False), unsafe_allow_html=True)
+    st.dataframe(
+        df, width="stretch", hide_index=True,
+        column_config={
+            "Map": st.column_config.LinkColumn("Map", display_text="Open"),
+            "Website": st.column_config.LinkColumn("Website", display_text="Open"),
+        },
+    )
 
     page_csv = df.to_csv(index=False).encode("utf-8")
-    st.download_button("Download This Page (CSV)", data=page_csv, file_name=f"results_page_{st.session_state.page}.csv", mime="text/csv")
-
-    with sqlite3.connect(DB_PATH) as con:
-        full_df = pd.read_sql(f"SELECT {', '.join(select_list)} FROM {TABLE} {where_sql} ORDER BY {order_expr}", con, params=params)
-    full_csv = full_df.to_csv(index=False).encode("utf-8")
-    st.download_button("Download All Filtered (CSV)", data=full_csv, file_name="results_filtered.csv", mime="text/csv")
+    st.download_button("Download This Page (CSV)", data=page_csv, file_name=f"results_page_{page}.csv", mime="text/csv")
+
+    # the full export only runs on request, and only for the filters it was requested with
+    # (not page size, which doesn't change its contents)
+    export_sig = (where_sql, tuple(params))
+    if st.button("Prepare All Filtered (CSV)"):
+        st.session_state.want_full_csv = export_sig
+    if st.session_state.get("want_full_csv") == export_sig:
+        full_csv = query_csv(con, f"SELECT {', '.join(select_list)} FROM {TABLE} {where_sql} ORDER BY {order_expr}, rowid", tuple(params))
+        st.download_button("Download All Filtered (CSV)", data=full_csv, file_name="results_filtered.csv", mime="text/csv")
 else:
     st.info("No results. Adjust filters or keyword.")
 